@@ -1,76 +1,356 @@
 
 
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_bytes
 
 
 # vision_service.py
 # OCR service using Google Cloud Vision API for text recognition and information extraction from images/documents.
 
-import base64
+import hashlib
+import logging
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import re
-import json
-import statistics
-from typing import List, Dict
+from typing import Any, List, Dict
 import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional, kernels then run as plain Python
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+try:
+    from pybase64 import b64encode
+except ImportError:  # pybase64 (SIMD base64) is optional, same output from the stdlib
+    from base64 import b64encode
+
+logger = logging.getLogger(__name__)
 
 API_KEY = os.environ.get("GOOGLE_VISION_API_KEY", "") 
+VISION_URL = "https://vision.googleapis.com/v1/images:annotate"
+VISION_FILES_URL = "https://vision.googleapis.com/v1/files:annotate"
+# Response fields the parser uses (partial response), per endpoint. Everything else (symbol boxes, confidences,
+# textAnnotations, ...) is left out server-side, which shrinks Vision responses several times.
+# error is kept: Vision reports failed images/pages inside a HTTP 200 response.
+_FULL_TEXT_FIELDS = (
+    "error",
+    "fullTextAnnotation.text",
+    "fullTextAnnotation.pages.width",
+    "fullTextAnnotation.pages.height",
+    "fullTextAnnotation.pages.blocks.boundingBox",
+    "fullTextAnnotation.pages.blocks.paragraphs.words(boundingBox,symbols.text)",
+)
+VISION_RESPONSE_FIELDS = {
+    VISION_URL: ",".join(f"responses.{f}" for f in _FULL_TEXT_FIELDS),
+    VISION_FILES_URL: ",".join(["responses.error"] + [f"responses.responses.{f}" for f in _FULL_TEXT_FIELDS]),
+}
+# Max pages Vision API accepts in a single files:annotate request.
+VISION_FILE_PAGES_PER_REQUEST = 5
+# Max images Vision API accepts in a single images:annotate request, and a budget
+# for the base64 payload of one request (Vision API rejects requests over 10 MB).
+VISION_IMAGES_PER_REQUEST = 16
+VISION_MAX_REQUEST_BYTES = 8 * 1024 * 1024
+# How PDFs are OCR'd: "native" sends the PDF itself to files:annotate,
+# "rasterize" converts each page to an image locally (pdf2image) and sends the images.
+# The native mode re-sends the whole PDF with every chunk of VISION_FILE_PAGES_PER_REQUEST pages, so PDFs
+# whose base64 is over VISION_MAX_REQUEST_BYTES (about 6 MB of PDF) are always rasterized.
+VISION_PDF_MODE = os.environ.get("VISION_PDF_MODE", "native")
+# Rasterization settings for VISION_PDF_MODE=rasterize. OCR accuracy on printed text
+# plateaus around 150 DPI; raise OCR_DPI for degraded scans.
+OCR_DPI = int(os.environ.get("OCR_DPI", 150))
+# Pages are rendered in grayscale and at most this many pixels on the long edge (large page formats
+# get a lower DPI), which keeps uploads small without hurting OCR of printed text.
+OCR_MAX_LONG_EDGE = 2000
+OCR_JPEG_OPTIONS = {"quality": 85, "progressive": True, "optimize": True}
+# Max number of Vision API requests in flight for a single PDF. Kept low by default
+# so a multi-page upload stays within the project's requests-per-second quota.
+VISION_CONCURRENCY = int(os.environ.get("VISION_CONCURRENCY", 4))
+# Max number of Vision API requests in flight for the whole process (all uploads together),
+# so concurrent uploads can't multiply the request rate past the quota.
+VISION_MAX_INFLIGHT = int(os.environ.get("VISION_MAX_INFLIGHT", 5))
+# Directory for caching Vision API results by file content hash (disabled if empty).
+VISION_CACHE_DIR = os.environ.get("VISION_CACHE_DIR", "")
+# Always rebuild the document text from word positions, even when Vision's own text order can be used
+# (see has_side_by_side_blocks).
+RESUME_FORCE_REORDER = os.environ.get("RESUME_FORCE_REORDER", "0") == "1"
+# Bump when the format of cached Vision results changes.
+VISION_CACHE_VERSION = 1
+# Part of every cache key (VISION_CACHE_DIR, and the parsed-result cache of the API view), so entries made
+# with other settings that change the OCR result or the response fields are not reused.
+VISION_CACHE_TAG = hashlib.sha256(repr((
+    VISION_CACHE_VERSION, VISION_PDF_MODE, OCR_DPI, OCR_MAX_LONG_EDGE, RESUME_FORCE_REORDER,
+    sorted(VISION_RESPONSE_FIELDS.values()),
+)).encode()).hexdigest()[:12]
+VISION_TIMEOUT = 30
+# Retry policy for rate-limited (429) and transient server (5xx) errors (see _post_vision).
+VISION_MAX_RETRIES = 3
+VISION_BACKOFF_FACTOR = 0.5
+VISION_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Shared session, so TCP/TLS connections to Vision API are reused across requests and threads.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+
+_INFLIGHT = threading.BoundedSemaphore(VISION_MAX_INFLIGHT)
+
+
+def _retry_delay(r, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a failed Vision request: the response's Retry-After (capped at
+    VISION_TIMEOUT) if any, otherwise exponential backoff with jitter.
+    """
+    retry_after = r.headers.get("Retry-After", "") if r is not None else ""
+    if retry_after.isdigit():
+        return min(float(retry_after), VISION_TIMEOUT)
+    return VISION_BACKOFF_FACTOR * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def _post_vision(payload: dict, endpoint: str = VISION_URL) -> dict:
+    """
+    POST a payload to Vision API and return the JSON response, limited to VISION_RESPONSE_FIELDS[endpoint].
+    Rate-limited and transient errors (VISION_RETRY_STATUSES, connection errors, timeouts) are retried
+    up to VISION_MAX_RETRIES times, honoring Retry-After, otherwise with exponential backoff.
+    At most VISION_MAX_INFLIGHT requests run at once, callers beyond that wait for a free slot;
+    the slot is released while waiting to retry, so a rate-limited upload doesn't stall the others.
+    Raises RuntimeError if Vision reports an error for any image or page of the request,
+    rather than returning it as a page without text.
+    """
+    # Serialized with orjson: payloads are mostly multi-MB base64 strings, which stdlib json encodes slowly
+    body = orjson.dumps(payload)
+    name = endpoint.rsplit("/", 1)[-1]
+    for attempt in range(VISION_MAX_RETRIES + 1):
+        r = None
+        with _INFLIGHT:
+            start = time.perf_counter()
+            try:
+                r = _SESSION.post(
+                    endpoint,
+                    params={"fields": VISION_RESPONSE_FIELDS[endpoint]},
+                    data=body,
+                    # Key in a header rather than the URL, so it never shows up in logged errors
+                    headers={"Content-Type": "application/json", "x-goog-api-key": API_KEY},
+                    timeout=VISION_TIMEOUT,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == VISION_MAX_RETRIES:
+                    raise
+                logger.warning("Vision %s: attempt %d failed: %s", name, attempt + 1, e)
+        if r is not None:
+            logger.debug(
+                "Vision %s: HTTP %d, %d requests, %d bytes sent, %.0f ms (attempt %d)",
+                name, r.status_code, len(payload.get("requests", [])), len(body),
+                (time.perf_counter() - start) * 1000, attempt + 1,
+            )
+            if r.status_code not in VISION_RETRY_STATUSES or attempt == VISION_MAX_RETRIES:
+                break
+        time.sleep(_retry_delay(r, attempt))
+    r.raise_for_status()
+    resp = orjson.loads(r.content)
+    _raise_on_vision_errors(resp, endpoint)
+    return resp
 
-def call_vision_api(file_path: str) -> dict:
+
+def _raise_on_vision_errors(resp: dict, endpoint: str) -> None:
+    """
+    Log and raise RuntimeError for the first error in a Vision response, per image (images:annotate),
+    or per file and page (files:annotate).
+    """
+    for i, response in enumerate(resp.get("responses") or []):
+        errors = [(f"request {i}", response.get("error"))]
+        errors += [(f"request {i} page {j + 1}", page.get("error")) for j, page in enumerate(response.get("responses") or [])]
+        for where, error in errors:
+            if error:
+                logger.warning("Vision %s: %s failed: %s", endpoint.rsplit("/", 1)[-1], where, error)
+                raise RuntimeError(f"Vision API error ({where}): {error.get('message', error)}")
+
+
+def _b64_size(n: int) -> int:
+    """
+    Size of n bytes once base64-encoded.
+    """
+    return -(-n // 3) * 4
+
+
+def _pages_per_batch(n_pages: int) -> int:
+    """
+    Number of pages per images:annotate request: pages are spread evenly over up to VISION_CONCURRENCY
+    requests (so small PDFs still run in parallel), with at most VISION_IMAGES_PER_REQUEST per request.
+    """
+    return min(VISION_IMAGES_PER_REQUEST, max(1, -(-n_pages // VISION_CONCURRENCY)))
+
+
+def _split_by_size(image_paths: List[str]) -> List[List[str]]:
+    """
+    Split page files, in order, into groups of about VISION_MAX_REQUEST_BYTES of base64 payload at most.
+    """
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for path in image_paths:
+        size = _b64_size(os.path.getsize(path))
+        if batch and batch_bytes + size > VISION_MAX_REQUEST_BYTES:
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(path)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+_RE_PAGE_SIZE = re.compile(r"([\d.]+) x ([\d.]+) pts")
+
+def _render_dpi(pdf_info: dict) -> int:
     """
-    Send an image (or PDF) file to Google Vision API and receive OCR analysis results.
-    If input is PDF, convert each page to image and OCR each page, then join results.
+    DPI to rasterize a PDF at: OCR_DPI, lowered so the long edge of the page fits in OCR_MAX_LONG_EDGE pixels.
+    Uses the "Page size" reported by pdfinfo (the first page's).
+    """
+    m = _RE_PAGE_SIZE.match(pdf_info.get("Page size", ""))
+    if not m:
+        return OCR_DPI
+    long_edge_pts = max(float(m.group(1)), float(m.group(2)))
+    if long_edge_pts <= 0:
+        return OCR_DPI
+    return max(1, min(OCR_DPI, int(OCR_MAX_LONG_EDGE * 72 / long_edge_pts)))
+
+
+def _ocr_page_batch(image_paths: List[str]) -> List[Dict]:
+    """
+    OCR a batch of rasterized PDF pages (JPEG files written by pdftocairo) in a single images:annotate request.
+    Returns one Vision API response entry per page, in the same order.
+    """
+    page_requests = []
+    for image_path in image_paths:
+        path = Path(image_path)
+        # Only the base64 string is kept: the raw bytes are dropped once encoded and the page
+        # file is deleted, so a batch's buffers are released as soon as its worker returns.
+        b64 = b64encode(path.read_bytes()).decode()
+        path.unlink()
+        page_requests.append({
+            "image": {"content": b64},
+            "features": [{"type": "DOCUMENT_TEXT_DETECTION"}]
+        })
+    resp = _post_vision({"requests": page_requests})
+    responses = resp.get("responses") or []
+    return responses + [{}] * (len(image_paths) - len(responses))
+
+
+def _annotate_pdf_native(data: bytes) -> List[Dict]:
+    """
+    OCR a PDF (data, the file contents) server-side with Vision API's files:annotate endpoint.
+    Pages are sent in chunks of VISION_FILE_PAGES_PER_REQUEST, chunks are requested concurrently;
+    each request carries the whole PDF, so data must fit in VISION_MAX_REQUEST_BYTES once base64-encoded.
+    Returns one Vision API response entry per page, in page order.
+    """
+    b64 = b64encode(data).decode()
+    n_pages = pdfinfo_from_bytes(data)["Pages"]
+    step = VISION_FILE_PAGES_PER_REQUEST
+    chunks = [list(range(first, min(first + step, n_pages + 1))) for first in range(1, n_pages + 1, step)]
+
+    def annotate(pages):
+        payload = {
+            "requests": [
+                {
+                    "inputConfig": {"content": b64, "mimeType": "application/pdf"},
+                    "features": [{"type": "DOCUMENT_TEXT_DETECTION"}],
+                    "pages": pages,
+                }
+            ]
+        }
+        resp = _post_vision(payload, VISION_FILES_URL)
+        return (resp.get("responses") or [{}])[0].get("responses") or []
+
+    with ThreadPoolExecutor(max_workers=VISION_CONCURRENCY) as ex:
+        return [page for chunk in ex.map(annotate, chunks) for page in chunk]
+
+
+def _annotate_pdf_rasterized(data: bytes) -> List[Dict]:
+    """
+    Convert each page of a PDF (data, the file contents) to an image and OCR the pages in concurrent batches (see _pages_per_batch).
+    Returns one Vision API response entry per page, in page order.
+    """
+    pdf_info = pdfinfo_from_bytes(data)
+    n_pages = pdf_info["Pages"]
+    dpi = _render_dpi(pdf_info)
+    step = _pages_per_batch(n_pages)
+    futures = []
+    # Convert PDF to JPEG files (one per page). pdftocairo rasterizes pages in parallel
+    # and encodes them to JPEG itself, so pages are sent as written to the temp dir,
+    # without being decoded and re-encoded through PIL (or kept as large PPM bitmaps).
+    # Pages are rendered one batch at a time and each batch is submitted as soon as it is
+    # written, so earlier batches are encoded and sent while later ones are still rendering.
+    # Note: each worker keeps its own file handles open; on macOS the default
+    # `ulimit -n` (256) can be hit on very large PDFs, raise it if conversion fails.
+    with tempfile.TemporaryDirectory() as tmp, ThreadPoolExecutor(max_workers=VISION_CONCURRENCY) as ex:
+        # poppler needs a file to read from, write the PDF once for all batches
+        file_path = os.path.join(tmp, "input.pdf")
+        with open(file_path, "wb") as f:
+            f.write(data)
+        for first in range(1, n_pages + 1, step):
+            image_paths = convert_from_path(
+                file_path,
+                dpi=dpi,
+                first_page=first,
+                last_page=min(first + step - 1, n_pages),
+                thread_count=min(os.cpu_count() or 1, 8),
+                output_folder=tmp,
+                fmt='jpeg',
+                jpegopt=OCR_JPEG_OPTIONS,
+                grayscale=True,
+                paths_only=True,
+                use_pdftocairo=True,
+            )
+            futures.extend(ex.submit(_ocr_page_batch, batch) for batch in _split_by_size(image_paths))
+        return [page for future in futures for page in future.result()]
+
+
+def _annotate_bytes(data: bytes, ext: str) -> dict:
+    """
+    Send an image (or PDF) file (data, the file contents; ext, its lowercase extension) to Google Vision API and receive OCR analysis results.
+    If input is PDF, OCR every page (see VISION_PDF_MODE), then join results in page order.
     Returns the JSON result dict from the API (for images) or merged text for PDFs.
+    Raises RuntimeError before any encoding or upload if GOOGLE_VISION_API_KEY is not set.
     """
-    ext = os.path.splitext(file_path)[1].lower()
-    url = f"https://vision.googleapis.com/v1/images:annotate?key={API_KEY}"
+    if not API_KEY:
+        raise RuntimeError("GOOGLE_VISION_API_KEY not set")
 
     if ext == '.pdf':
-        # Convert PDF to images (one per page)
-        images = convert_from_path(file_path)
+        if VISION_PDF_MODE == "rasterize":
+            results = _annotate_pdf_rasterized(data)
+        elif _b64_size(len(data)) > VISION_MAX_REQUEST_BYTES:
+            logger.info("PDF too large for files:annotate (%d bytes), rasterizing pages", len(data))
+            results = _annotate_pdf_rasterized(data)
+        else:
+            results = _annotate_pdf_native(data)
         merged_text = []
-        merged_text_annotations = []
         merged_pages = []
-        for img in images:
-            from io import BytesIO
-            img_bytes = BytesIO()
-            img.save(img_bytes, format='JPEG')
-            b64 = base64.b64encode(img_bytes.getvalue()).decode()
-            payload = {
-                "requests": [
-                    {
-                        "image": {"content": b64},
-                        "features": [{"type": "DOCUMENT_TEXT_DETECTION"}]
-                    }
-                ]
-            }
-            r = requests.post(url, json=payload)
-            r.raise_for_status()
-            resp = r.json()
-            response = resp.get("responses", [{}])[0]
-            # Merge fullTextAnnotation text
-            full = response.get("fullTextAnnotation")
-            if full and 'text' in full:
-                merged_text.append(full['text'])
-                if 'pages' in full:
-                    merged_pages.extend(full['pages'])
-            else:
-                ta = response.get("textAnnotations", [])
-                raw = ta[0].get("description") if ta else ""
-                merged_text.append(raw)
-            # Merge textAnnotations
-            ta = response.get("textAnnotations", [])
-            if ta:
-                merged_text_annotations.extend(ta)
+        for response in results:
+            # Pages without text have no fullTextAnnotation
+            full = response.get("fullTextAnnotation") or {}
+            merged_text.append(full.get("text", ""))
+            merged_pages.extend(full.get("pages", []))
         # Build a response structure similar to Vision API
         merged_full = {
             "text": "\n".join(merged_text),
             "pages": merged_pages,
         }
-        return {"responses": [{"fullTextAnnotation": merged_full, "textAnnotations": merged_text_annotations}]}
+        return {"responses": [{"fullTextAnnotation": merged_full}]}
     else:
-        with open(file_path, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode()
+        b64 = b64encode(data).decode()
         payload = {
             "requests": [
                 {
@@ -79,9 +359,42 @@ def call_vision_api(file_path: str) -> dict:
                 }
             ]
         }
-        r = requests.post(url, json=payload)
-        r.raise_for_status()
-        return r.json()
+        return _post_vision(payload)
+
+
+def call_vision_api_bytes(data: bytes, ext: str) -> dict:
+    """
+    Send the contents of an image (or PDF) file, with its extension (e.g. ".pdf"), to Google Vision API
+    and receive OCR analysis results (see _annotate_bytes).
+    If VISION_CACHE_DIR is set, results are cached there by SHA-256 of the file contents and VISION_CACHE_TAG,
+    so re-submitting the same file skips the API call.
+    """
+    ext = ext.lower()
+    logger.info("OCR %s file (%d bytes)", ext, len(data))
+    if not VISION_CACHE_DIR:
+        return _annotate_bytes(data, ext)
+
+    cache_path = os.path.join(VISION_CACHE_DIR, f"{hashlib.sha256(data).hexdigest()}-{VISION_CACHE_TAG}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            return orjson.loads(f.read())
+    resp = _annotate_bytes(data, ext)
+    os.makedirs(VISION_CACHE_DIR, exist_ok=True)
+    # Write to a temp file and rename it, so readers never see a partially written entry
+    with tempfile.NamedTemporaryFile("wb", dir=VISION_CACHE_DIR, suffix=".tmp", delete=False) as f:
+        f.write(orjson.dumps(resp))
+    os.replace(f.name, cache_path)
+    return resp
+
+def call_vision_api(file_path: str) -> dict:
+    """
+    Send an image (or PDF) file to Google Vision API and receive OCR analysis results (see call_vision_api_bytes).
+    """
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(file_path)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return call_vision_api_bytes(data, os.path.splitext(file_path)[1])
 
 
 
@@ -92,185 +405,235 @@ def _safe_get(v, key, default=0):
     """
     return v.get(key, default) if isinstance(v, dict) else default
 
-def extract_word_boxes(full_text_annotation: dict) -> List[Dict]:
+def extract_word_boxes(full_text_annotation: dict) -> Dict[str, Any]:
     """
     Extract words and their bounding boxes from Vision API's fullTextAnnotation result.
-    Returns a list of dicts: {text, minx, miny, maxx, maxy, cx, cy, h, page}
-    """
-    words = []
+    Returns a struct of arrays: {"text": list of str, and NumPy arrays "minx", "miny", "maxx", "maxy", "cx", "cy", "h", "page"},
+    where index i of every entry describes the i-th word.
+    Coordinates are in pixels. PDFs OCR'd with files:annotate only have normalizedVertices (fractions of the page),
+    those are scaled to pixels as if the page had been rasterized at OCR_DPI (page width/height are in points),
+    so the pixel-based thresholds of group_words_to_lines apply to both PDF modes.
+    """
+    texts = []
+    page_ids = []
+    coords = []
     pages = full_text_annotation.get("pages", [])
     for p_idx, page in enumerate(pages):
+        # Page size in pixels at OCR_DPI, A4 if Vision didn't report it
+        scale_x = (page.get("width") or 595) * OCR_DPI / 72
+        scale_y = (page.get("height") or 842) * OCR_DPI / 72
         for block in page.get("blocks", []):
             for para in block.get("paragraphs", []):
                 for word in para.get("words", []):
                     symbols = word.get("symbols", [])
-                    word_text = "".join([s.get("text", "") for s in symbols])
-                    verts = word.get("boundingBox", {}).get("vertices", [])
-                    xs = [(_safe_get(v, "x", 0)) for v in verts]
-                    ys = [(_safe_get(v, "y", 0)) for v in verts]
-                    if not xs: xs = [0, 0, 0, 0]
-                    if not ys: ys = [0, 0, 0, 0]
-                    minx, maxx = min(xs), max(xs)
-                    miny, maxy = min(ys), max(ys)
-                    cx = (minx + maxx) / 2.0
-                    cy = (miny + maxy) / 2.0
-                    h = maxy - miny
-                    words.append({
-                        "text": word_text,
-                        "minx": minx, "maxx": maxx,
-                        "miny": miny, "maxy": maxy,
-                        "cx": cx, "cy": cy,
-                        "h": h if h>0 else 10,
-                        "page": p_idx
-                    })
-    return words
-
-def group_words_to_lines(words: List[Dict]) -> List[List[Dict]]:
-    """
-    Group words into lines based on y position (cy) and page.
-    Returns a list of lines, each line is a list of words.
-    """
-    if not words:
+                    texts.append("".join([s.get("text", "") for s in symbols]))
+                    page_ids.append(p_idx)
+                    box = word.get("boundingBox", {})
+                    verts = box.get("vertices")
+                    normalized = not verts and "normalizedVertices" in box
+                    if normalized:
+                        verts = box["normalizedVertices"]
+                    verts = (verts or [])[:4] or [{}]
+                    # Pad to 4 vertices by repeating the last one, which leaves min/max unchanged
+                    verts = verts + verts[-1:] * (4 - len(verts))
+                    if normalized:
+                        for v in verts:
+                            coords.append(_safe_get(v, "x", 0) * scale_x)
+                            coords.append(_safe_get(v, "y", 0) * scale_y)
+                    else:
+                        for v in verts:
+                            coords.append(_safe_get(v, "x", 0))
+                            coords.append(_safe_get(v, "y", 0))
+    verts_arr = np.array(coords, dtype=np.float64).reshape(-1, 4, 2)
+    minx, maxx = verts_arr[:, :, 0].min(axis=1), verts_arr[:, :, 0].max(axis=1)
+    miny, maxy = verts_arr[:, :, 1].min(axis=1), verts_arr[:, :, 1].max(axis=1)
+    h = maxy - miny
+    return {
+        "text": texts,
+        "minx": minx, "maxx": maxx,
+        "miny": miny, "maxy": maxy,
+        "cx": (minx + maxx) * 0.5, "cy": (miny + maxy) * 0.5,
+        "h": np.where(h > 0, h, 10),
+        "page": np.array(page_ids, dtype=np.int64),
+    }
+
+@njit(cache=True, nogil=True)
+def _line_starts(page, cy, threshold):
+    """
+    Given the page and cy of words sorted by (page, cy, minx), return the indices where each line starts.
+    A word starts a new line if it is on another page than the previous word, or its cy is further
+    than threshold from the running mean cy of the current line.
+    """
+    n = len(cy)
+    starts = np.empty(n, dtype=np.int64)
+    starts[0] = 0
+    n_starts = 1
+    line_cy_sum = cy[0]
+    line_len = 1
+    for k in range(1, n):
+        if page[k] != page[k - 1] or abs(cy[k] - line_cy_sum / line_len) > threshold:
+            starts[n_starts] = k
+            n_starts += 1
+            line_cy_sum = cy[k]
+            line_len = 1
+        else:
+            line_cy_sum += cy[k]
+            line_len += 1
+    return starts[:n_starts]
+
+def group_words_to_lines(words: Dict[str, Any]) -> List[np.ndarray]:
+    """
+    Group words (as returned by extract_word_boxes) into lines based on y position (cy) and page.
+    Returns a list of lines, each line is an array of word indices ordered left to right.
+    """
+    if not words["text"]:
         return []
-    words_sorted = sorted(words, key=lambda w: (w["page"], w["cy"], w["minx"]))
-    heights = [w["h"] for w in words_sorted if w["h"] > 0]
-    median_h = statistics.median(heights) if heights else 12
+    page, cy, minx = words["page"], words["cy"], words["minx"]
+    order = np.lexsort((minx, cy, page))
+    page_sorted, cy_sorted = page[order], cy[order]
+    if not HAVE_NUMBA:
+        # Without numba the kernel runs as plain Python, which indexes lists much faster than arrays
+        page_sorted, cy_sorted = page_sorted.tolist(), cy_sorted.tolist()
+    heights = words["h"][words["h"] > 0]
+    median_h = float(np.median(heights)) if heights.size else 12
     line_threshold = max(10, median_h * 0.8)
-    lines = []
-    current_line = [words_sorted[0]]
-    def current_line_center(line):
-        return statistics.mean([w["cy"] for w in line])
-    for w in words_sorted[1:]:
-        if w["page"] != current_line[-1]["page"] or abs(w["cy"] - current_line_center(current_line)) > line_threshold:
-            lines.append(current_line)
-            current_line = [w]
-        else:
-            current_line.append(w)
-    lines.append(current_line)
-    for i in range(len(lines)):
-        lines[i] = sorted(lines[i], key=lambda x: x["minx"])
-    return lines
+    starts = _line_starts(page_sorted, cy_sorted, float(line_threshold))
+    lines = np.split(order, starts[1:])
+    return [line[np.argsort(minx[line], kind="stable")] for line in lines]
 
-def reconstruct_text_from_lines(lines: List[List[Dict]]) -> str:
+def reconstruct_text_from_lines(words: Dict[str, Any], lines: List[np.ndarray]) -> str:
     """
     Join words into lines (separated by spaces), then join lines into the final text.
     """
-    out_lines = []
-    for line in lines:
-        words_text = [w["text"] for w in line if w["text"].strip() != ""]
-        if words_text:
-            out_lines.append(" ".join(words_text))
-    raw_text = "\n".join(out_lines)
-
-
-    return raw_text
+    texts = words["text"]
+    # Blank words are skipped without allocating (isspace instead of strip), lines left empty are dropped
+    joined_lines = (
+        " ".join(t for t in map(texts.__getitem__, line.tolist()) if t and not t.isspace())
+        for line in lines
+    )
+    return "\n".join(ln for ln in joined_lines if ln)
+
+def has_side_by_side_blocks(full_text_annotation: dict) -> bool:
+    """
+    Check whether any page has text blocks next to each other (overlapping vertically by at least half
+    the smaller block's height), e.g. multi-column layouts or form labels with their values in another block.
+    Vision's fullTextAnnotation.text lists such blocks one after the other instead of line by line,
+    so the text must then be rebuilt from word positions (see group_words_to_lines).
+    Block boxes may be in pixels (vertices) or page fractions (normalizedVertices, files:annotate), the check
+    compares boxes of one page along each axis separately so it works with either.
+    Returns True as well if some block has no boundingBox, since the layout can't be checked.
+    """
+    for page in full_text_annotation.get("pages", []):
+        boxes = []
+        for block in page.get("blocks", []):
+            box = block.get("boundingBox", {})
+            verts = box.get("vertices") or box.get("normalizedVertices")
+            if not verts:
+                return True
+            xs = [_safe_get(v, "x", 0) for v in verts]
+            ys = [_safe_get(v, "y", 0) for v in verts]
+            boxes.append((min(xs), max(xs), min(ys), max(ys)))
+        if len(boxes) < 2:
+            continue
+        minx, maxx, miny, maxy = np.array(boxes, dtype=np.float64).T
+        overlap_y = np.minimum(maxy[:, None], maxy[None, :]) - np.maximum(miny[:, None], miny[None, :])
+        min_h = np.minimum(maxy - miny, (maxy - miny)[:, None])
+        left_of = maxx[:, None] <= minx[None, :]
+        # A zero-width block would otherwise be "left of" itself
+        np.fill_diagonal(left_of, False)
+        if (left_of & (overlap_y > 0) & (overlap_y >= min_h * 0.5)).any():
+            return True
+    return False
+
+# Date patterns, compiled once at import. re.ASCII keeps \d on the fast ASCII-only path.
+# All date formats are matched in a single scan, longest format first; m.lastgroup tells which one matched.
+_RE_DATES = re.compile(
+    r"(?P<full>\b(?P<day>\d{1,2})[\/\.\- ]+(?P<month>\d{1,2})[\/\.\- ]+(?P<year>\d{2,4})\b)"
+    r"|(?P<mm_yyyy>\b(?P<mm_month>\d{1,2})[\/\.\- ]+(?P<mm_year>\d{4})\b)"
+    r"|(?P<year_only>\b(?:19|20)\d{2}\b)",
+    re.ASCII,
+)
+_RE_YEAR_EXACT = re.compile(r"^(19|20)\d{2}$", re.ASCII)
+# Maps the date separators other than "/" to spaces for normalize_date_str
+_TR_TO_SPACE = str.maketrans(".-", "  ")
 
 def find_dates_candidates(text: str):
         """
-        Find date-like strings in the text.
-        Returns a tuple (full_date, mm/yyyy, year_only)
-        - full: list of Match objects for dd/mm/yyyy, dd-mm-yyyy, dd.mm.yyyy, etc.
-            Each match: group(0) is the full date string, group(1) is day, group(2) is month, group(3) is year.
-        - mm_yyyy: list of Match objects for mm/yyyy, mm-yyyy, mm.yyyy, etc.
-            Each match: group(0) is the full string, group(1) is month, group(2) is year.
-        - year_only: list of Match objects for 4-digit years (1900-2099).
-            Each match: group(0) is the year string.
+        Find date-like strings in the text, in a single pass over it.
+        Returns a tuple (full_date, mm/yyyy, year_only) of lists of Match objects, in text order.
+        Matches don't overlap: the year of a full date is not reported again as mm/yyyy or year_only.
+        - full: Match objects for dd/mm/yyyy, dd-mm-yyyy, dd.mm.yyyy, etc.
+            Each match: group("full") is the full date string, group("day"), group("month"), group("year").
+        - mm_yyyy: Match objects for mm/yyyy, mm-yyyy, mm.yyyy, etc.
+            Each match: group("mm_yyyy") is the full string, group("mm_month") is month, group("mm_year") is year.
+        - year_only: Match objects for 4-digit years (1900-2099).
+            Each match: group("year_only") is the year string.
         """
-        # Example: full = [<re.Match object; span=(10, 20), match='27/01/1990'>, ...]
-        full = list(re.finditer(r"\b(\d{1,2})[\/\.\- ]+(\d{1,2})[\/\.\- ]+(\d{2,4})\b", text))
-        # Example: mm_yyyy = [<re.Match object; span=(10, 17), match='01/1990'>, ...]
-        mm_yyyy = list(re.finditer(r"\b(\d{1,2})[\/\.\- ]+(\d{4})\b", text))
-        # Example: year_only = [<re.Match object; span=(10, 14), match='1990'>, ...]
-        year_only = list(re.finditer(r"\b(19|20)\d{2}\b", text))
-        return full, mm_yyyy, year_only
+        # Example: "Sinh 27/01/1990, tốt nghiệp 06/2012" -> full: ['27/01/1990'], mm_yyyy: ['06/2012']
+        found = {"full": [], "mm_yyyy": [], "year_only": []}
+        for m in _RE_DATES.finditer(text):
+            found[m.lastgroup].append(m)
+        return found["full"], found["mm_yyyy"], found["year_only"]
+
+
 
+def _parse_int_or(s: str, default: int, lo: int, hi: int) -> int:
+    """
+    Parse s as an integer in [lo, hi]. Returns default if s is missing, not a number or out of range.
+    """
+    if not s or not s.isdecimal():
+        return default
+    n = int(s)
+    return n if lo <= n <= hi else default
 
+def _parse_year(s: str) -> int:
+    """
+    Parse s as a year, 2-digit years > 30 map to 19xx and the rest to 20xx. Returns 1900 if s is not a number.
+    """
+    if not s or not s.isdecimal():
+        return 1900
+    yy = int(s)
+    if len(s) == 2:
+        yy = 1900 + yy if yy > 30 else 2000 + yy
+    return yy
 
 def normalize_date_str(dstr: str) -> str:
     if not dstr:
         return None
     dstr = dstr.strip()
 
-    d = re.sub(r"[.\- ]+", "/", dstr)
-    d = d.strip("/")
-
-    parts = d.split("/")
-    
+    # "/" delimits fields, so "27//1990" keeps an empty month. Runs of ".", "-" and spaces, also around
+    # a single "/" (e.g. "27 / 01 / 1990"), count as one separator. Empty fields at either end are dropped.
+    parts = []
+    for field in dstr.split("/"):
+        parts.extend(field.translate(_TR_TO_SPACE).split() or [""])
+    while parts and not parts[-1]:
+        parts.pop()
+    while parts and not parts[0]:
+        parts.pop(0)
+
+    # Map parts to (day, month, year) slots; day is None for month/year dates
     if len(parts) >= 4:
-        year_candidates = [p for p in parts if p.isdigit() and (int(p) >= 1900 or int(p) >= 1000)]
-        if year_candidates:
-            yy = year_candidates[-1]  
-        else:
-            yy = parts[-1]  
-
+        year_candidates = [p for p in parts if p.isdecimal() and int(p) >= 1000]
+        yy = year_candidates[-1] if year_candidates else parts[-1]
         other_parts = [p for p in parts if p != yy]
-
-        try:
-            dd = int(other_parts[0])
-            if dd < 1 or dd > 31:
-                dd = 27 
-        except:
-            dd = 27
-
-        try:
-            mm = int(other_parts[1])
-            if mm < 1 or mm > 12:
-                mm = 8
-        except:
-            mm = 8
-
-        try:
-            yy_num = int(yy)
-            if len(yy) == 2:
-                yy_num = 1900 + yy_num if yy_num > 30 else 2000 + yy_num
-        except:
-            yy_num = 1900
-
-        return f"{yy_num:04d}-{mm:02d}-{dd:02d}"
-
-    if len(parts) == 3:
+        dd = other_parts[0] if other_parts else ""
+        mm = other_parts[1] if len(other_parts) > 1 else ""
+    elif len(parts) == 3:
         dd, mm, yy = parts
-        try:
-            dd_num = int(dd)
-            if dd_num < 1 or dd_num > 31:
-                dd_num = 27
-        except:
-            dd_num = 27
-        try:
-            mm_num = int(mm)
-            if mm_num < 1 or mm_num > 12:
-                mm_num = 8
-        except:
-            mm_num = 8
-        try:
-            yy_num = int(yy)
-            if len(yy) == 2:
-                yy_num = 1900 + yy_num if yy_num > 30 else 2000 + yy_num
-        except:
-            yy_num = 1900
-        return f"{yy_num:04d}-{mm_num:02d}-{dd_num:02d}"
-
-    if len(parts) == 2:
+    elif len(parts) == 2:
+        dd = None
         mm, yy = parts
-        try:
-            mm_num = int(mm)
-            if mm_num < 1 or mm_num > 12:
-                mm_num = 8
-        except:
-            mm_num = 8
-        try:
-            yy_num = int(yy)
-            if len(yy) == 2:
-                yy_num = 1900 + yy_num if yy_num > 30 else 2000 + yy_num
-        except:
-            yy_num = 1900
-        return f"{yy_num:04d}-{mm_num:02d}"
-
-    m = re.match(r"^(19|20)\d{2}$", d)
-    if m:
-        return d
+    else:
+        d = parts[0] if parts else ""
+        return d if _RE_YEAR_EXACT.match(d) else dstr
 
-    return dstr
+    yy_num = _parse_year(yy)
+    mm_num = _parse_int_or(mm, 8, 1, 12)
+    if dd is None:
+        return f"{yy_num:04d}-{mm_num:02d}"
+    dd_num = _parse_int_or(dd, 27, 1, 31)
+    return f"{yy_num:04d}-{mm_num:02d}-{dd_num:02d}"
 
 def clean_text(text: str) -> str:
     """
@@ -279,132 +642,162 @@ def clean_text(text: str) -> str:
     if not text:
         return text
     text = text.strip(" .:;,-_…")
-    text = re.sub(r'[\.…]+', ' ', text)
-    text = text.replace('.', '').replace(',', '').replace('…', '')
-    text = re.sub(r'\s+', ' ', text)
+    text = text.replace('.', ' ').replace('…', ' ').replace(',', '')
+    text = ' '.join(text.split())
     return text
 
 
-# Name anchor patterns for extraction (Vietnamese & English, can be updated easily)
-NAME_ANCHOR_PATTERNS_VI = r"(?:tên tôi là|tên|họ và tên)"
-NAME_ANCHOR_PATTERNS_EN = r"(?:my name is|name|full name)"
+# Name anchor patterns for extraction (Vietnamese & English, can be updated easily; keep longer alternatives first)
+NAME_ANCHOR_PATTERNS_VI = r"(?:tên tôi là|họ và tên|tên)"
+NAME_ANCHOR_PATTERNS_EN = r"(?:my name is|full name|name)"
 # Header patterns to ignore when extracting name (Vietnamese & English)
 HEADER_IGNORE_PATTERNS_VI = r"cộng hòa|độc lập"
 HEADER_IGNORE_PATTERNS_EN = r"united states"
 
-
-def extract_text_after(rex: str, lines: list) -> str:
+# Field patterns, compiled once at import
+_RE_HEADER_IGNORE = re.compile(f"{HEADER_IGNORE_PATTERNS_VI}|{HEADER_IGNORE_PATTERNS_EN}")
+_RE_LETTER = re.compile(r"[A-Za-zÀ-ỹĐđ]")
+_RE_FOREIGN_LANGUAGE = re.compile(r"Ngoại\s*ngữ[:\-]?\s*(.+)", re.IGNORECASE)
+_RE_FOREIGN_LANGUAGE_LABEL = re.compile(r"Ngoại\s*ngữ", re.IGNORECASE)
+_RE_PROFESSION = re.compile(r"Nghề\s*nghiệp\s*chuyên\s*môn[:\-]?\s*(.+)", re.IGNORECASE)
+_RE_MAJOR = re.compile(r"Ngành[:\-\s]*\s*(.+)", re.IGNORECASE)
+_RE_CULTURAL_LEVEL = re.compile(r"Trình\s*độ\s*văn\s*hóa[:\-]?\s*(.+)", re.IGNORECASE)
+_RE_ADDRESS = re.compile(r"Địa\s*chỉ[:\-]?\s*(.+)", re.IGNORECASE)
+_RE_NON_DIGIT = re.compile(r"\D", re.ASCII)
+_RE_PHONE_VN = re.compile(r"\b(0\d{9,10})\b", re.ASCII)
+_RE_PHONE_ANY = re.compile(r"\b(\d{9,11})\b", re.ASCII)
+
+# Anchored fields searched over the whole text: (group, anchor, value pattern).
+# For each group only the first match in the text is kept; for name, phone and birth date the groups
+# are tried in the order listed here (e.g. name_vi wins over name_en wherever they occur).
+# The value (after the separators) is captured in a lookahead, in the named group "<group>__v",
+# so a match only consumes its anchor.
+ANCHOR_SEPARATORS = r"[:\s\-.]*"
+ANCHOR_FIELDS = [
+    ("name_vi", NAME_ANCHOR_PATTERNS_VI, r"[^:\s\-.].*"),
+    ("name_en", NAME_ANCHOR_PATTERNS_EN, r"[^:\s\-.].*"),
+    ("phone_vi", r"Số\s*điện\s*thoại", r"[\d\s\-\.]+"),
+    ("phone_en", r"Phone", r"[\d\s\-\.]+"),
+    ("birth_vi", r"Ngày\s*sinh", r"\d[\d\/\.\- ]*"),
+    ("birth_year_vi", r"Sinh\s*năm", r"\d[\d\/\.\- ]*"),
+    ("birth_en", r"Date\s*of\s*Birth", r"\d[\d\/\.\- ]*"),
+    ("birth_date_en", r"Birth\s*date", r"\d[\d\/\.\- ]*"),
+]
+_RE_ANCHORS = re.compile(
+    "|".join(
+        f"(?P<{group}>{anchor}(?={ANCHOR_SEPARATORS}(?P<{group}__v>{value})))"
+        for group, anchor, value in ANCHOR_FIELDS
+    ),
+    re.IGNORECASE,
+)
+
+
+def _value_after_label(m: re.Match) -> str:
+    return clean_text(m.group(1).strip(" .:"))
+
+def _cultural_level_value(m: re.Match) -> str:
+    # 'Trình độ văn hóa' is often followed by 'Ngoại ngữ' on the same line, keep only the part before it
+    return clean_text(_RE_FOREIGN_LANGUAGE_LABEL.split(m.group(1))[0])
+
+# Fields whose value is the text after a label on the same line: (field, pattern, post-process)
+# - address: 'Địa chỉ'
+# - cultural_level: 'Trình độ văn hóa'
+# - profession: 'Nghề nghiệp chuyên môn'
+# - major: 'Ngành'
+# - foreign_language: 'Ngoại ngữ'
+LINE_FIELDS = [
+    ("address", _RE_ADDRESS, _value_after_label),
+    ("cultural_level", _RE_CULTURAL_LEVEL, _cultural_level_value),
+    ("profession", _RE_PROFESSION, _value_after_label),
+    ("major", _RE_MAJOR, _value_after_label),
+    ("foreign_language", _RE_FOREIGN_LANGUAGE, _value_after_label),
+]
+
+def extract_line_fields(lines: list) -> dict:
+    """
+    Extracts all LINE_FIELDS from the document lines in a single pass.
+    Each field takes its value from the first line matching its label (case-insensitive);
+    fields that are never found are None.
+    """
+    results = {field: None for field, _, _ in LINE_FIELDS}
+    unresolved = LINE_FIELDS
     for ln in lines:
-        m = re.search(rex, ln, flags=re.IGNORECASE)
-        if m:
-            return clean_text(m.group(1).strip(" .:"))
-    return None
-
-def extract_foreign_language(lines: list) -> str:
-    """
-    Extracts the foreign language from the document lines.
-    Looks for a line containing 'Ngoại ngữ' (case-insensitive) and returns the text after it,
-    """
-    return extract_text_after(r"Ngoại\s*ngữ[:\-]?\s*(.+)", lines)
-
-def extract_profession(lines: list) -> str:
-    """
-    Extracts the profession (nghề nghiệp chuyên môn) from the document lines.
-    Looks for a line containing 'Nghề nghiệp chuyên môn:' (case-insensitive) and returns the text after it,
-    with special characters and trailing dots removed.
-    """
-    return extract_text_after(r"Nghề\s*nghiệp\s*chuyên\s*môn[:\-]?\s*(.+)", lines)
-
-def extract_major(lines: list) -> str:
-    """
-    Extracts the major (ngành) from the document lines.
-    Looks for a line containing 'Ngành:' (case-insensitive) and returns the text after it.
-    """
-    return extract_text_after(r"Ngành[:\-\s]*\s*(.+)", lines)
-
-def extract_cultural_level(lines: list) -> str:
-    """
-    Extracts the cultural level (Trình độ văn hóa) from the document lines.
-    Looks for a line containing 'Trình độ văn hóa:' (case-insensitive) and returns the text after it.
-    """
-    # Tìm dòng chứa 'Trình độ văn hóa'
-    for ln in lines:
-        m = re.search(r"Trình\s*độ\s*văn\s*hóa[:\-]?\s*(.+)", ln, flags=re.IGNORECASE)
-        if m:
-            val = m.group(1)
-            cut = re.split(r"Ngoại\s*ngữ", val, flags=re.IGNORECASE)
-            return clean_text(cut[0]) if cut else clean_text(val)
-    return None
+        if not unresolved:
+            break
+        pending = []
+        for field, pat, post_process in unresolved:
+            m = pat.search(ln)
+            if m:
+                results[field] = post_process(m)
+            else:
+                pending.append((field, pat, post_process))
+        unresolved = pending
+    return results
 
-def extract_address(lines: list) -> str:
+def find_anchor_values(text: str) -> dict:
     """
-    Extracts the address from the document lines.
-    Looks for a line containing 'Địa chỉ:' (case-insensitive) and returns the text after it.
+    Scans the text once for all ANCHOR_FIELDS.
+    Returns {group: value} with the value following the first occurrence of each anchor that was found.
     """
-    return extract_text_after(r"Địa\s*chỉ[:\-]?\s*(.+)", lines)
+    found = {}
+    for m in _RE_ANCHORS.finditer(text):
+        group = m.lastgroup
+        if group not in found:
+            found[group] = m.group(f"{group}__v")
+            if len(found) == len(ANCHOR_FIELDS):
+                break
+    return found
 
-def extract_name(lines: list, joined: str) -> str:
+def extract_name(lines: list, anchors: dict) -> str:
     """
-    Extracts the name from the document lines and joined text.
+    Extracts the name from the anchor values (see find_anchor_values), falling back to the document lines.
     """
     # Try to find name after anchor patterns (Vietnamese or English)
     name = None
-    m = re.search(fr"{NAME_ANCHOR_PATTERNS_VI}[:\s\-]*(.+)", joined, flags=re.IGNORECASE)
-    if not m:
-        m = re.search(fr"{NAME_ANCHOR_PATTERNS_EN}[:\s\-]*(.+)", joined, flags=re.IGNORECASE)
-    if m:
-        candidate = m.group(1).strip()
+    candidate = anchors.get("name_vi") or anchors.get("name_en")
+    if candidate:
+        candidate = candidate.strip()
         candidate = candidate.split("\n")[0].strip()
         name = candidate.strip(" .:")
     else:
         for ln in reversed(lines):
-            if len(ln.split()) >= 2 and re.search(r"[A-Za-zÀ-ỹĐđ]", ln):
-                if re.search(HEADER_IGNORE_PATTERNS_VI, ln.lower()) or re.search(HEADER_IGNORE_PATTERNS_EN, ln.lower()):
+            if len(ln.split()) >= 2 and _RE_LETTER.search(ln):
+                if _RE_HEADER_IGNORE.search(ln.lower()):
                     continue
                 name = ln
                 break
     return name
 
-def extract_phone(joined: str) -> str:
+def extract_phone(text: str, anchors: dict) -> str:
     """
-    Extracts the phone number from the joined document text.
+    Extracts the phone number from the anchor values (see find_anchor_values), falling back to the document text.
     """
     phone = None
-    phone_anchors = [
-        r"Số\s*điện\s*thoại[:\s\-]*([\d\s\-\.]+)",
-        r"Phone[:\s\-]*([\d\s\-\.]+)",
-    ]
-    for pat in phone_anchors:
-        m = re.search(pat, joined, flags=re.IGNORECASE)
-        if m:
-            phone_candidate = re.sub(r"\D", "", m.group(1))
+    for group in ("phone_vi", "phone_en"):
+        value = anchors.get(group)
+        if value:
+            phone_candidate = _RE_NON_DIGIT.sub("", value)
             if 9 <= len(phone_candidate) <= 12:
                 phone = phone_candidate
                 break
     if not phone:
-        mphone = re.search(r"\b(0\d{9,10})\b", joined)
+        mphone = _RE_PHONE_VN.search(text)
         if mphone:
             phone = mphone.group(1)
         else:
-            m2 = re.search(r"\b(\d{9,11})\b", joined)
+            m2 = _RE_PHONE_ANY.search(text)
             phone = m2.group(1) if m2 else None
     return phone
 
-def extract_birth_date(joined: str) -> str:
+def extract_birth_date(anchors: dict) -> str:
     """
-    Extracts the birth date from the joined document text.
+    Extracts the birth date from the anchor values (see find_anchor_values).
     """
-    birth_anchors = [
-        r"Ngày\s*sinh[:\s\-]*([\d\/\.\- ]+)",
-        r"Sinh\s*năm[:\s\-]*([\d\/\.\- ]+)",
-        r"Date\s*of\s*Birth[:\s\-]*([\d\/\.\- ]+)",
-        r"Birth\s*date[:\s\-]*([\d\/\.\- ]+)",
-    ]
     birth_date = None
-    for pat in birth_anchors:
-        m = re.search(pat, joined, flags=re.IGNORECASE)
-        if m:
-            birth_date = normalize_date_str(m.group(1))
+    for group in ("birth_vi", "birth_year_vi", "birth_en", "birth_date_en"):
+        value = anchors.get(group)
+        if value:
+            birth_date = normalize_date_str(value)
             break
     return birth_date
 
@@ -422,19 +815,15 @@ def parse_document_text(doc_text: str) -> dict:
     Analyze OCR text to extract fields: name, phone, birth_date, experience.
     Uses heuristics and regex to find relevant information.
     """
-    # Preprocess: split lines, remove leading/trailing spaces and punctuation
+    # Preprocess: split lines, remove leading/trailing spaces and punctuation.
+    # The anchor scan may span lines and runs on doc_text directly, its patterns already skip whitespace.
     lines = [ln.strip(" .:") for ln in doc_text.splitlines() if ln.strip()]
-    joined = "\n".join(lines)
-    # lower = joined.lower()
-
-    name = extract_name(lines, joined)
-    phone = extract_phone(joined)
-    birth_date = extract_birth_date(joined)
-    address = extract_address(lines)
-    profession = extract_profession(lines)
-    foreign_language = extract_foreign_language(lines)
-    major = extract_major(lines)
-    cultural_level = extract_cultural_level(lines)
+
+    anchors = find_anchor_values(doc_text)
+    name = extract_name(lines, anchors)
+    phone = extract_phone(doc_text, anchors)
+    birth_date = extract_birth_date(anchors)
+    line_fields = extract_line_fields(lines)
 
     # --- Experience extraction (not implemented) ---
     experience_list = []
@@ -443,28 +832,42 @@ def parse_document_text(doc_text: str) -> dict:
         "name": name,
         "phone": phone,
         "birth_date": birth_date,
-        "address": address,
-        "cultural_level": cultural_level,
-        "profession": profession,
-        "major": major,
-        "foreign_language": foreign_language,
+        "address": line_fields["address"],
+        "cultural_level": line_fields["cultural_level"],
+        "profession": line_fields["profession"],
+        "major": line_fields["major"],
+        "foreign_language": line_fields["foreign_language"],
         "experience": experience_list
     }
 
-def ocr_reorder_and_parse(file_path: str) -> dict:
+def ocr_reorder_and_parse_bytes(data: bytes, ext: str) -> dict:
     """
-    Main function: OCR an image/document file, reconstruct text, and extract key information.
+    Main function: OCR the contents of an image/document file, with its extension (e.g. ".pdf"),
+    reconstruct text (from word positions, only if the layout needs it), and extract key information.
     Returns a dict with document_text (full text) and parsed (extracted fields).
     """
-    resp = call_vision_api(file_path)
-    full = resp.get("responses", [{}])[0].get("fullTextAnnotation")
+    resp = call_vision_api_bytes(data, ext)
+    response = (resp.get("responses") or [{}])[0]
+    full = response.get("fullTextAnnotation")
     if not full:
-        ta = resp.get("responses", [{}])[0].get("textAnnotations", [])
-        raw = ta[0].get("description") if ta else ""
-        document_text = raw
+        # No text detected
+        document_text = ""
+    elif full.get("text") and not RESUME_FORCE_REORDER and not has_side_by_side_blocks(full):
+        # Single-column layout: Vision's text is already in reading order
+        document_text = full["text"]
     else:
         words = extract_word_boxes(full)
         lines = group_words_to_lines(words)
-        document_text = reconstruct_text_from_lines(lines)
+        document_text = reconstruct_text_from_lines(words, lines)
     parsed = parse_document_text(document_text)
-    return {"document_text": document_text, "parsed": parsed}
\ No newline at end of file
+    return {"document_text": document_text, "parsed": parsed}
+
+def ocr_reorder_and_parse(file_path: str) -> dict:
+    """
+    OCR an image/document file, reconstruct text, and extract key information (see ocr_reorder_and_parse_bytes).
+    """
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(file_path)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    return ocr_reorder_and_parse_bytes(data, os.path.splitext(file_path)[1])
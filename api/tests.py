@@ -1,3 +1,221 @@
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from .services import vision_service
+from .services.vision_service import (
+    OCR_DPI,
+    extract_word_boxes,
+    find_anchor_values,
+    group_words_to_lines,
+    has_side_by_side_blocks,
+    normalize_date_str,
+    parse_document_text,
+    reconstruct_text_from_lines,
+)
+
+
+class NormalizeDateStrTests(TestCase):
+    def test_day_month_year(self):
+        self.assertEqual(normalize_date_str("12/05/1990"), "1990-05-12")
+        self.assertEqual(normalize_date_str("12.05.1990"), "1990-05-12")
+        self.assertEqual(normalize_date_str("12-05-90"), "1990-05-12")
+        self.assertEqual(normalize_date_str("12 05 1990"), "1990-05-12")
+        self.assertEqual(normalize_date_str("1/2/05"), "2005-02-01")
+
+    def test_month_year(self):
+        self.assertEqual(normalize_date_str("05/1990"), "1990-05")
+        self.assertEqual(normalize_date_str("5.1990"), "1990-05")
+
+    def test_year_only(self):
+        self.assertEqual(normalize_date_str("1990"), "1990")
+        self.assertEqual(normalize_date_str(" / 1990"), "1990")
+        self.assertEqual(normalize_date_str("/1990/"), "1990")
+
+    def test_out_of_range_parts_use_placeholders(self):
+        self.assertEqual(normalize_date_str("27/13/1990"), "1990-08-27")
+        self.assertEqual(normalize_date_str("32/01/1990"), "1990-01-27")
+        self.assertEqual(normalize_date_str("ab/cd/ef"), "1900-08-27")
+
+    def test_empty_field_between_slashes(self):
+        # "/" delimits fields, an empty one falls back to its placeholder
+        self.assertEqual(normalize_date_str("27//1990"), "1990-08-27")
+        self.assertEqual(normalize_date_str("12//05/1990"), "1990-08-12")
+
+    def test_padding_around_slash_is_one_separator(self):
+        self.assertEqual(normalize_date_str("27 / 01 / 1990"), "1990-01-27")
+        self.assertEqual(normalize_date_str("27 - 01 - 1990"), "1990-01-27")
+        self.assertEqual(normalize_date_str("12./05"), "2005-12")
+
+    def test_not_a_date(self):
+        self.assertIsNone(normalize_date_str(""))
+        self.assertEqual(normalize_date_str("abc"), "abc")
+
+
+FORM_RESUME = (
+    "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM\n"
+    "Độc lập - Tự do - Hạnh phúc\n"
+    "SƠ YẾU LÝ LỊCH\n"
+    "Họ và tên: Nguyễn Văn An\n"
+    "Ngày sinh: 12/05/1990\n"
+    "Số điện thoại: 0912 345 678\n"
+    "Địa chỉ: 12 Lê Lợi, Quận 1, TP.HCM\n"
+    "Trình độ văn hóa: 12/12 Ngoại ngữ: Tiếng Anh\n"
+    "Nghề nghiệp chuyên môn: Kỹ sư\n"
+    "Ngành: Công nghệ thông tin"
+)
+
+
+class ParseDocumentTextTests(TestCase):
+    def test_form_resume(self):
+        self.assertEqual(parse_document_text(FORM_RESUME), {
+            "name": "Nguyễn Văn An",
+            "phone": "0912345678",
+            "birth_date": "1990-05-12",
+            "address": "12 Lê Lợi Quận 1 TP HCM",
+            "cultural_level": "12/12",
+            "profession": "Kỹ sư",
+            "major": "Công nghệ thông tin",
+            "foreign_language": "Tiếng Anh",
+            "experience": [],
+        })
+
+    def test_english_anchors(self):
+        parsed = parse_document_text("Full name: John Smith\nDate of Birth: 01/01/1988\nPhone: 0901 234 567")
+        self.assertEqual(parsed["name"], "John Smith")
+        self.assertEqual(parsed["birth_date"], "1988-01-01")
+        self.assertEqual(parsed["phone"], "0901234567")
+
+    def test_vietnamese_name_anchor_wins_over_english(self):
+        parsed = parse_document_text("Name: John Smith\nHọ và tên: Nguyễn Văn An")
+        self.assertEqual(parsed["name"], "Nguyễn Văn An")
+
+    def test_dotted_leaders_take_value_from_next_line(self):
+        doc = "Họ và tên: ..........\nNguyễn Thị Bình\nNgày sinh: .....\n01.02.1995"
+        parsed = parse_document_text(doc)
+        self.assertEqual(parsed["name"], "Nguyễn Thị Bình")
+        self.assertEqual(parsed["birth_date"], "1995-02-01")
+
+    def test_empty_anchor_falls_through_to_next_anchor(self):
+        # 'Số điện thoại' has no digits, the 'Phone' anchor is used instead
+        values = find_anchor_values("Số điện thoại: ....\nPhone: 0987654321")
+        self.assertEqual(values["phone_en"], "0987654321")
+        self.assertEqual(parse_document_text("Số điện thoại: ....\nPhone: 0987654321")["phone"], "0987654321")
+
+    def test_name_falls_back_to_last_non_header_line(self):
+        doc = "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM\nSơ yếu lý lịch\nTrần Văn Cường\nCỘNG HÒA"
+        self.assertEqual(parse_document_text(doc)["name"], "Trần Văn Cường")
+
+    def test_phone_without_anchor(self):
+        self.assertEqual(parse_document_text("SĐT 0912345678 Email")["phone"], "0912345678")
+        # Digit patterns use re.ASCII, so a Vietnamese letter right after the digits still ends the number
+        self.assertEqual(parse_document_text("0912345678Địa chỉ: Hà Nội")["phone"], "0912345678")
+        self.assertIsNone(parse_document_text("mã số 0912345678123")["phone"])
+
+    def test_missing_fields_are_none(self):
+        parsed = parse_document_text("Sơ yếu lý lịch")
+        self.assertIsNone(parsed["phone"])
+        self.assertIsNone(parsed["birth_date"])
+        self.assertIsNone(parsed["address"])
+
+
+def _box(x0, y0, x1, y1, key="vertices"):
+    return {key: [{"x": x0, "y": y0}, {"x": x1, "y": y0}, {"x": x1, "y": y1}, {"x": x0, "y": y1}]}
+
+
+def _blocks_page(*boxes, key="vertices"):
+    return {"pages": [{"blocks": [{"boundingBox": _box(*b, key=key)} for b in boxes]}]}
+
+
+class HasSideBySideBlocksTests(TestCase):
+    def test_stacked_blocks(self):
+        self.assertFalse(has_side_by_side_blocks(_blocks_page((50, 100, 500, 140), (50, 160, 500, 200))))
+
+    def test_label_and_value_blocks_side_by_side(self):
+        self.assertTrue(has_side_by_side_blocks(_blocks_page((50, 100, 200, 120), (250, 102, 500, 122))))
+
+    def test_small_vertical_overlap_is_not_side_by_side(self):
+        # Less than half the smaller block's height
+        self.assertFalse(has_side_by_side_blocks(_blocks_page((50, 100, 200, 120), (250, 115, 500, 135))))
+
+    def test_block_without_bounding_box(self):
+        full = _blocks_page((50, 100, 500, 140))
+        full["pages"][0]["blocks"].append({})
+        self.assertTrue(has_side_by_side_blocks(full))
+
+    def test_normalized_vertices(self):
+        stacked = _blocks_page((0.1, 0.10, 0.9, 0.12), (0.1, 0.15, 0.9, 0.17), key="normalizedVertices")
+        side_by_side = _blocks_page((0.1, 0.10, 0.3, 0.12), (0.4, 0.10, 0.9, 0.12), key="normalizedVertices")
+        self.assertFalse(has_side_by_side_blocks(stacked))
+        self.assertTrue(has_side_by_side_blocks(side_by_side))
+
+    def test_zero_width_block(self):
+        self.assertFalse(has_side_by_side_blocks(_blocks_page((100, 100, 100, 120), (50, 160, 500, 200))))
+
+    def test_blocks_on_different_pages(self):
+        full = {"pages": _blocks_page((50, 100, 200, 120))["pages"] + _blocks_page((250, 100, 500, 120))["pages"]}
+        self.assertFalse(has_side_by_side_blocks(full))
+
+
+def _word(text, x0, y0, x1, y1, page_size=None):
+    """
+    A Vision word; with page_size (width, height) its box is given as normalizedVertices, like files:annotate.
+    """
+    if page_size:
+        w, h = page_size
+        return {"boundingBox": _box(x0 / w, y0 / h, x1 / w, y1 / h, key="normalizedVertices"), "symbols": [{"text": text}]}
+    return {"boundingBox": _box(x0, y0, x1, y1), "symbols": [{"text": text}]}
+
+
+class WordBoxesTests(TestCase):
+    def test_normalized_vertices_pdf_page(self):
+        # files:annotate page: size in points, word boxes as fractions of the page
+        size = (595, 842)
+        rows = [["Họ", "và", "tên:", "Nguyễn", "Văn", "A"], ["Địa", "chỉ:", "Hà", "Nội"], ["Ngành:", "CNTT"]]
+        words = [
+            _word(t, 50 + c * 40, 100 + r * 16, 85 + c * 40, 110 + r * 16, page_size=size)
+            for r, row in enumerate(rows) for c, t in enumerate(row)
+        ]
+        full = {"pages": [{"width": size[0], "height": size[1], "blocks": [{"paragraphs": [{"words": words}]}]}]}
+        boxes = extract_word_boxes(full)
+        # Scaled to pixels as if rasterized at OCR_DPI
+        self.assertAlmostEqual(boxes["minx"][0], 50 * OCR_DPI / 72)
+        self.assertAlmostEqual(boxes["maxy"][0], 110 * OCR_DPI / 72)
+        text = reconstruct_text_from_lines(boxes, group_words_to_lines(boxes))
+        self.assertEqual(text, "Họ và tên: Nguyễn Văn A\nĐịa chỉ: Hà Nội\nNgành: CNTT")
+
+
+# Plain Python version of the line grouping kernel (the function itself when numba is not installed)
+_line_starts_py = getattr(vision_service._line_starts, "py_func", vision_service._line_starts)
+
+
+def _two_page_annotation():
+    """
+    Words 20px high. Page 1: B (cy 100) and A (cy 112, further left) form one line; C (cy 124) is within the
+    threshold (16) of A but not of the line's running mean (106), so it starts a new line with D (cy 136).
+    Page 2: E at cy 100, same height as B but on another page.
+    """
+    def page(*words):
+        return {"blocks": [{"paragraphs": [{"words": [_word(t, x, cy - 10, x + 40, cy + 10) for t, x, cy in words]}]}]}
+    return {"pages": [
+        page(("B", 300, 100), ("A", 50, 112), ("C", 50, 124), ("D", 300, 136)),
+        page(("E", 50, 100)),
+    ]}
+
+
+class GroupWordsToLinesTests(TestCase):
+    def test_line_starts_kernel(self):
+        starts = _line_starts_py([0, 0, 0, 0, 1], [100.0, 112.0, 124.0, 136.0, 100.0], 16.0)
+        self.assertEqual(list(starts), [0, 2, 4])
+
+    def _reconstruct(self):
+        boxes = extract_word_boxes(_two_page_annotation())
+        return reconstruct_text_from_lines(boxes, group_words_to_lines(boxes))
+
+    def test_group_words_to_lines(self):
+        self.assertEqual(self._reconstruct(), "A B\nC D\nE")
+
+    def test_group_words_to_lines_without_numba(self):
+        with mock.patch.object(vision_service, "HAVE_NUMBA", False), \
+                mock.patch.object(vision_service, "_line_starts", _line_starts_py):
+            self.assertEqual(self._reconstruct(), "A B\nC D\nE")
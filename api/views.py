@@ -1,35 +1,50 @@
+import hashlib
 import os
-from rest_framework.decorators import api_view
+from adrf.decorators import api_view
+from asgiref.sync import sync_to_async
 from rest_framework.response import Response
-from django.conf import settings
-from .services.vision_service import ocr_reorder_and_parse
+from django.core.cache import cache
+from .services.vision_service import VISION_CACHE_TAG, ocr_reorder_and_parse_bytes
 
-@api_view(['POST'])
-def extract_resume(request):
+# How long parsed results are kept for re-submitted files (seconds)
+OCR_CACHE_TIMEOUT = 60 * 60
+
+SUPPORTED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.pdf']
+
+def _read_upload(request):
+    """
+    Parse the multipart body and read the 'file' upload in memory, in one call (no per-chunk copies and join).
+    Returns (file name, data, SHA-256 hex digest); (None, None, None) if no file was sent, and
+    (file name, None, None) if its extension is not supported, without reading it.
+    """
     file = request.FILES.get('file')
     if not file:
+        return None, None, None
+    if os.path.splitext(file.name)[1].lower() not in SUPPORTED_EXTENSIONS:
+        return file.name, None, None
+    data = file.read()
+    return file.name, data, hashlib.sha256(data).hexdigest()
+
+@api_view(['POST'])
+async def extract_resume(request):
+    # Read the upload in memory instead of saving it under MEDIA_ROOT (no name clashes between
+    # concurrent uploads, no write/read/delete round-trip). Parsing the multipart body (which spools
+    # large uploads to a temp file) and reading it both block, so they run off the event loop.
+    filename, data, digest = await sync_to_async(_read_upload, thread_sensitive=False)(request)
+    if filename is None:
         return Response({"error": "No file provided"}, status=400)
-    
-    filename = file.name
-    filepath = os.path.join(settings.MEDIA_ROOT, filename)
-    with open(filepath, 'wb+') as dest:
-        for chunk in file.chunks():
-            dest.write(chunk)
-    
-    ext = os.path.splitext(filename)[1].lower()
-    if ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.pdf']:
-        # Dùng Google Vision API cho cả ảnh và PDF
-        result = ocr_reorder_and_parse(filepath)
-        # Xóa file sau khi xử lý xong
-        try:
-            os.remove(filepath)
-        except Exception:
-            pass
-        return Response(result["parsed"])
-    else:
-        # Xóa file nếu không đúng định dạng
-        try:
-            os.remove(filepath)
-        except Exception:
-            pass
+    if data is None:
         return Response({"error": "Unsupported file type"}, status=400)
+    ext = os.path.splitext(filename)[1].lower()
+
+    # The tag changes with the OCR settings, so results parsed under other settings are not reused
+    cache_key = f"ocr:{VISION_CACHE_TAG}:{digest}"
+    parsed = await cache.aget(cache_key)
+    if parsed is None:
+        # Dùng Google Vision API cho cả ảnh và PDF.
+        # The OCR call blocks for seconds (Vision round-trips, rasterization), run it in a worker thread
+        # so the event loop keeps serving other requests meanwhile.
+        result = await sync_to_async(ocr_reorder_and_parse_bytes, thread_sensitive=False)(data, ext)
+        parsed = result["parsed"]
+        await cache.aset(cache_key, parsed, OCR_CACHE_TIMEOUT)
+    return Response(parsed)
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     ## Edit
     'rest_framework',  
+    'adrf',
     'api',             
 ]
 